@@ -26,6 +26,12 @@ export async function getCharacterProfile(slug: string) {
   return result[0]?.profile || null;
 }
 
+type TimelineScene = {
+  sceneId: string;
+  text: string;
+  characters: { name: string; slug: string }[];
+};
+
 export async function getTimeline({
   page = 1,
   pageSize = 10,
@@ -40,40 +46,24 @@ export async function getTimeline({
   const skip = (page - 1) * pageSize;
   const sortOrder = sort.toUpperCase() === "ASC" ? "ASC" : "DESC";
 
+  // Reads the per-episode snapshots materialised by the scraper's update run
+  const match = slug
+    ? "MATCH (c:Character {slug: $slug})-[:FEATURED_IN]->(e:Episode)"
+    : "MATCH (e:Episode) WHERE e.scene_count > 0";
+
   const countCypher = `
-    MATCH (e:Episode)<-[:PART_OF]-(s:Scene)
-      ${slug ? "MATCH (:Character {slug: $slug})-[:APPEARS_IN]->(s)" : ""}
-    RETURN count(DISTINCT e) AS totalCount
+    ${match}
+    RETURN count(e) AS totalCount
   `;
 
   const dataCypher = `
-      MATCH (e:Episode)
-      ${slug ? "MATCH (c:Character {slug: $slug})-[:APPEARS_IN]->(s:Scene)-[:PART_OF]->(e)" : ""}
-            
-      MATCH (e:Episode)
-      ${slug ? "MATCH (target:Character {slug: $slug})-[:APPEARS_IN]->(s:Scene)-[:PART_OF]->(e)" : "MATCH (s:Scene)-[:PART_OF]->(e)"}
-      
-      OPTIONAL MATCH (other:Character)-[:APPEARS_IN]->(s)
-      ${slug ? "WHERE other <> target" : ""}
-
-      WITH e, s, [x IN collect(DISTINCT {
-        name: other.name,
-        slug: other.slug
-      }) WHERE x.slug IS NOT NULL] AS characters
-      ORDER BY e.date ${sortOrder}, s.id ASC
-
-      WITH e, collect({
-        sceneId: s.id,
-        text: s.text,
-        characters: characters
-      }) AS scenes
-      
-      RETURN e.pid AS pid,
-             e.date AS date,
-             scenes
-      ORDER BY e.date ${sortOrder}
-      SKIP $skip LIMIT $limit
-    `;
+    ${match}
+    RETURN e.pid AS pid,
+           e.date AS date,
+           e.timeline AS timeline
+    ORDER BY e.date ${sortOrder}
+    SKIP $skip LIMIT $limit
+  `;
 
   const [countRes, dataRes] = await Promise.all([
     executeQuery(countCypher, { slug }),
@@ -86,11 +76,24 @@ export async function getTimeline({
 
   return {
     totalCount: countRes[0]?.totalCount.toNumber() || 0,
-    episodes: dataRes.map((rec) => ({
-      pid: rec.pid,
-      date: rec.date.toString(),
-      scenes: rec.scenes,
-    })),
+    episodes: dataRes.map((rec) => {
+      const scenes: TimelineScene[] = JSON.parse(rec.timeline);
+
+      return {
+        pid: rec.pid,
+        date: rec.date.toString(),
+        scenes: slug
+          ? scenes
+              .filter((scene) =>
+                scene.characters.some((c) => c.slug === slug),
+              )
+              .map((scene) => ({
+                ...scene,
+                characters: scene.characters.filter((c) => c.slug !== slug),
+              }))
+          : scenes,
+      };
+    }),
   };
 }
 
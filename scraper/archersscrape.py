@@ -1,166 +1,101 @@
 import os
-import json
 import argparse
 import sys
 import time
-from datetime import datetime
+from datetime import date
 
-from web_scraper import WebScraper
-from processor import process_batch
-from database import ArchersDatabase
-from cache import load_cache
+from constants import AUTO_MERGE_MAX_LENGTH
+from cache import load_cache, derived_path, env_series_ids, series_cache_files
 
 
-def scrape_episodes(series_id, cache_file, cached_data, last_cached_date):
-    scraper = WebScraper()
+def search_scenes(args):
+    from search_index import SearchIndex, load_characters, character_phrases
 
-    if not last_cached_date:
-        print("No cache found. Performing full scrape...")
-        episodes = scraper.get_all_episodes(series_id)
-        with open(cache_file, "w") as f:
-            json.dump(episodes, f)
-        return episodes
+    cache_template = os.getenv("CACHE_FILE")
+    cache_files = [path for path in series_cache_files(env_series_ids()).values() if os.path.exists(path)]
+    if not cache_files:
+        raise ValueError(f"No cache file found for {cache_template}; run 'update' first")
 
-    print(f"Searching for episodes newer than {last_cached_date}...")
-    new_episodes = []
-    current_page = 1
-    found_overlap = False
+    index_dir = os.getenv("SEARCH_INDEX_DIR") or derived_path(cache_template, "index")
 
-    while not found_overlap:
-        print(f"Checking page {current_page}...")
-        page_results = scraper.get_paginated_episodes(series_id, first_page=current_page, last_page=current_page)
+    with SearchIndex(index_dir) as index:
+        if args.rebuild or not index.is_current(cache_files):
+            cached_data = [ep for path in cache_files for ep in load_cache(path)[0]]
+            index.update(cache_files, cached_data, rebuild=args.rebuild)
 
-        if not page_results:
-            break
+        search_start = time.perf_counter()
+        characters = load_characters() if args.character else []
+        results = index.search(
+            terms=args.terms,
+            phrases=args.phrase,
+            characters=[character_phrases(name, characters) for name in args.character],
+            from_date=args.from_date,
+            to_date=args.to_date,
+            limit=args.limit
+        )
+        elapsed_ms = (time.perf_counter() - search_start) * 1000
 
-        for ep in page_results:
-            ep_date = datetime.strptime(ep['date'], "%Y-%m-%d").date()
-            if ep_date > last_cached_date:
-                new_episodes.append(ep)
+        for doc in results:
+            print(f"\n{doc['date']}  {doc['sid']}")
+            print(doc['text'])
+
+        print(f"\n{len(results)} scene(s) shown in {elapsed_ms:.1f}ms")
+
+
+def run_db_command(args):
+    from database import ArchersDatabase
+
+    with ArchersDatabase(skip_setup=args.skip_setup) as db:
+        if args.command == 'link':
+            if args.from_file:
+                print(f"Linking characters to scenes from {args.from_file}...")
+                db.manual_link_characters_from_file(args.from_file)
+            else:
+                print(f"Linking character '{args.character}' to scenes...")
+                db.manual_link_character_to_scenes(args.scenes, args.character)
+        elif args.command == 'cleanup':
+            if args.auto:
+                db.auto_cleanup_empty_scenes(args.review_file, max_length=args.max_length)
             else:
-                found_overlap = True
-                break
-
-        if not found_overlap:
-            current_page += 1
-
-    if new_episodes:
-        print(f"Found {len(new_episodes)} new episode(s).")
-        with open(cache_file, "w") as f:
-            json.dump(new_episodes + cached_data, f)
-    else:
-        print("No new episodes found.")
-
-    return new_episodes
-
-
-def rescrape_single_scene_episodes(db):
-    pids = db.find_single_scene_episodes()
-    if not pids:
-        return []
-
-    print(f"Found {len(pids)} recent episode(s) with only 1 scene — re-scraping...")
-    scraper = WebScraper()
-    episodes = [scraper.get_episode(pid) for pid in pids]
-    episodes = [ep for ep in episodes if ep is not None]
-
-    rescrape_pids = [ep['pid'] for ep in episodes]
-    if rescrape_pids:
-        db.delete_episodes(rescrape_pids)
-
-    return episodes
-
-
-def update_db(from_cache=False, dry_run=False):
-    start_time = time.perf_counter()
-
-    cache_file = os.getenv("CACHE_FILE")
-    if not cache_file:
-        raise ValueError("CACHE_FILE environment variable is not set")
-
-    if not from_cache:
-        series_id = os.getenv("SERIES_ID")
-        if not series_id:
-            raise ValueError("SERIES_ID environment variable is not set (required when not using --from-cache)")
-
-    cached_data, last_cached_date = load_cache(cache_file)
-
-    if from_cache:
-        if not cached_data:
-            print("Error: No cache file found to reset from.")
-            return
-        episodes_to_process = cached_data
-    else:
-        scrape_start = time.perf_counter()
-        episodes_to_process = scrape_episodes(series_id, cache_file, cached_data, last_cached_date)
-        print(f"Scraping completed in {time.perf_counter() - scrape_start:.2f}s")
-
-    if not episodes_to_process:
-        episodes_to_process = []
-
-    process_start = time.perf_counter()
-
-    with ArchersDatabase() as db:
-        # Re-scrape recent episodes that only had 1 scene (incomplete blurb)
-        if not from_cache:
-            rescraped = rescrape_single_scene_episodes(db)
-            if rescraped:
-                existing_pids = {ep['pid'] for ep in episodes_to_process}
-                for ep in rescraped:
-                    if ep['pid'] not in existing_pids:
-                        episodes_to_process.append(ep)
-
-        if not episodes_to_process:
-            print("No episodes to process.")
-            return
-
-        print(f"Processing {len(episodes_to_process)} episodes...")
-        detailed_episode_data = process_batch(episodes_to_process)
-        print(f"Processing completed in {time.perf_counter() - process_start:.2f}s")
-
-        if not detailed_episode_data:
-            return
-
-        if dry_run:
-            total_scenes = sum(len(ep['scenes']) for ep in detailed_episode_data)
-            dates = [ep['date'] for ep in detailed_episode_data]
-            print(f"\n--- DRY RUN SUMMARY ---")
-            print(f"Episodes to process: {len(detailed_episode_data)}")
-            print(f"Date range: {min(dates)} to {max(dates)}")
-            print(f"Total scenes: {total_scenes}")
-            print(f"Average scenes per episode: {total_scenes / len(detailed_episode_data):.1f}")
-            print(f"Dry run completed in {time.perf_counter() - start_time:.2f}s")
-            return
-
-        upsert_start = time.perf_counter()
-        db.add_episodes_with_scenes(detailed_episode_data)
-        print(f"Database upsert completed in {time.perf_counter() - upsert_start:.2f}s")
-
-        if from_cache or len(detailed_episode_data) > 10:
-            cleanup_start = time.perf_counter()
-            db.handle_duplicate_episodes()
-            print(f"Cleanup completed in {time.perf_counter() - cleanup_start:.2f}s")
-
-        link_start = time.perf_counter()
-        new_pids = [ep['pid'] for ep in detailed_episode_data]
-        db.link_all_characters_to_scenes(episode_pids=new_pids)
-        print(f"Character linking completed in {time.perf_counter() - link_start:.2f}s")
-
-    print(f"\nTotal update time: {time.perf_counter() - start_time:.2f}s")
+                db.cleanup_empty_scenes()
+        elif args.command == 'snapshot':
+            db.refresh_timeline_snapshots()
+        elif args.command == 'coappear':
+            db.rebuild_co_appearances()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Neo4j Ambridge database")
+    parser.add_argument('--skip-setup', action='store_true', help="Skip the empty-database check, initial data import and schema/snapshot migration")
     subparsers = parser.add_subparsers(dest="command")
 
     update_parser = subparsers.add_parser('update', help='Scrape new episodes or reset from cache')
     update_parser.add_argument('--from-cache', action='store_true', help="Clear and rebuild DB from cache")
+    update_parser.add_argument('--series', type=str, nargs='+', help="Series IDs to scrape (defaults to SERIES_ID, comma-separated); the first uses CACHE_FILE")
     update_parser.add_argument('--dry-run', action='store_true', help="Run scrape and process steps without database operations")
 
     link_parser = subparsers.add_parser('link', help='Manually link a character to a scene')
-    link_parser.add_argument('--scenes', type=str, nargs='+', required=True, help='List of scene IDs (space-separated)')
-    link_parser.add_argument('--character', type=str, required=True, help='Character name or ID')
+    link_parser.add_argument('--scenes', type=str, nargs='+', help='List of scene IDs (space-separated)')
+    link_parser.add_argument('--character', type=str, help='Character name or ID')
+    link_parser.add_argument('--from-file', type=str, help="CSV of links with 'character' and 'scene' columns")
 
-    subparsers.add_parser('cleanup', help='Review and merge empty scenes')
+    cleanup_parser = subparsers.add_parser('cleanup', help='Review and merge empty scenes')
+    cleanup_parser.add_argument('--auto', action='store_true', help="Merge short or lowercase fragments without prompting")
+    cleanup_parser.add_argument('--max-length', type=int, default=AUTO_MERGE_MAX_LENGTH, help="Longest fragment merged automatically with --auto")
+    cleanup_parser.add_argument('--review-file', type=str, default="cleanup_review.csv", help="CSV for fragments left for manual review with --auto")
+
+    search_parser = subparsers.add_parser('search', help='Search processed scenes from the episode cache (no database needed)')
+    search_parser.add_argument('terms', type=str, nargs='*', help='Words that must all appear in the scene')
+    search_parser.add_argument('--phrase', type=str, action='append', default=[], help='Exact phrase to match (repeatable)')
+    search_parser.add_argument('--character', type=str, action='append', default=[], help='Character name or alias to match (repeatable)')
+    search_parser.add_argument('--from', dest='from_date', type=date.fromisoformat, help='Earliest episode date (YYYY-MM-DD)')
+    search_parser.add_argument('--to', dest='to_date', type=date.fromisoformat, help='Latest episode date (YYYY-MM-DD)')
+    search_parser.add_argument('--limit', type=int, default=20, help='Maximum number of scenes to show')
+    search_parser.add_argument('--rebuild', action='store_true', help='Rebuild the search index from scratch')
+
+    subparsers.add_parser('snapshot', help='Rebuild timeline snapshots for all episodes')
+
+    subparsers.add_parser('coappear', help='Rebuild character co-appearance aggregates from scratch')
 
     args = parser.parse_args()
 
@@ -168,16 +103,21 @@ def main():
         parser.print_help()
         return
 
+    if args.command == 'link' and not args.from_file and not (args.scenes and args.character):
+        link_parser.error("either --from-file or both --scenes and --character are required")
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
     try:
         if args.command == 'update':
-            update_db(args.from_cache, dry_run=args.dry_run)
-        elif args.command == 'link':
-            with ArchersDatabase() as db:
-                print(f"Linking character '{args.character}' to scenes...")
-                db.manual_link_character_to_scenes(args.scenes, args.character)
-        elif args.command == 'cleanup':
-            with ArchersDatabase() as db:
-                db.cleanup_empty_scenes()
+            import asyncio
+            from pipeline import update_db
+            asyncio.run(update_db(args.series, from_cache=args.from_cache, dry_run=args.dry_run, skip_setup=args.skip_setup))
+        elif args.command == 'search':
+            search_scenes(args)
+        else:
+            run_db_command(args)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
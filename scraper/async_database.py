@@ -0,0 +1,272 @@
+import os
+from neo4j import AsyncGraphDatabase
+from database import (
+    CHECKED_SETUPS,
+    neo4j_credentials,
+    setup_statements,
+    timeline_snapshots,
+    co_appearance_deltas,
+)
+from queries import (
+    CHECK_DB_EXISTS,
+    ADD_EPISODES_WITH_SCENES,
+    CLEANUP_ORPHANS,
+    CLEANUP_EXACT_DUPLICATES,
+    CLEANUP_THIN_REPEATS,
+    CLEANUP_DATE_SHIFTS,
+    LINK_SHARED_TERMS_PREAMBLE,
+    LINK_PASS1_BODY,
+    LINK_PASS2_BODY,
+    FIND_SINGLE_SCENE_EPISODES,
+    DELETE_EPISODES,
+    CREATE_EPISODE_DATE_INDEX,
+    FIND_EPISODES_WITHOUT_SNAPSHOT,
+    FIND_TIMELINE_SCENES,
+    WRITE_TIMELINE_SNAPSHOTS,
+    FIND_SCENE_CASTS,
+    FIND_COUNTED_SCENE,
+    ADD_CO_APPEARANCES,
+    REMOVE_CO_APPEARANCES,
+    SET_SCENE_CASTS,
+    CLEAR_CO_APPEARANCES,
+    REBUILD_CO_APPEARANCES,
+    REBUILD_SCENE_CASTS,
+)
+
+CLEANUP_QUERIES = {
+    "orphans": CLEANUP_ORPHANS,
+    "exact_duplicates": CLEANUP_EXACT_DUPLICATES,
+    "thin_repeats": CLEANUP_THIN_REPEATS,
+    "date_shifts": CLEANUP_DATE_SHIFTS,
+}
+
+
+def format_episode_batch(episode_list):
+    formatted_batch = []
+    for ep in episode_list:
+        pid = ep["pid"]
+        formatted_batch.append({
+            "pid": pid,
+            "date": ep["date"],
+            "synopsis": ep["synopsis"],
+            "scenes": [
+                {
+                    "sid": f"{pid}_{i}",
+                    "index": i,
+                    "text": text
+                }
+                for i, text in enumerate(ep["scenes"])
+            ]
+        })
+    return formatted_batch
+
+
+def link_queries(episode_pids=None):
+    pid_filter = "AND e.pid IN $pids" if episode_pids is not None else ""
+
+    pass1_query = LINK_SHARED_TERMS_PREAMBLE + LINK_PASS1_BODY.format(pid_filter=pid_filter)
+    pass2_query = LINK_SHARED_TERMS_PREAMBLE + LINK_PASS2_BODY.format(pid_filter=pid_filter)
+    params = {'pids': episode_pids} if episode_pids is not None else {}
+    return pass1_query, pass2_query, params
+
+
+# Database layer for the update pipeline; ArchersDatabase covers the one-off commands.
+# Setup is not run on entry so callers can overlap it with scraping; await
+# setup_database() before writing.
+class AsyncArchersDatabase:
+    def __init__(self, setup_file="import_base_data.txt", skip_setup=False):
+        module_dir = os.path.dirname(os.path.abspath(__file__))
+        self.setup_file_path = os.path.join(module_dir, setup_file)
+        self.skip_setup = skip_setup
+
+        uri, auth = neo4j_credentials()
+        self.setup_key = (uri, self.setup_file_path)
+        self.driver = AsyncGraphDatabase.driver(uri, auth=auth)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+        return False
+
+    async def close(self):
+        await self.driver.close()
+
+    async def _read(self, query, **params):
+        async with self.driver.session() as session:
+            result = await session.run(query, **params)
+            return [rec async for rec in result]
+
+    # Writes go through managed transactions so concurrent pipelined writes that
+    # hit a lock conflict are retried by the driver instead of failing the run
+    async def _write(self, query, **params):
+        async def work(tx):
+            result = await tx.run(query, **params)
+            records = [rec async for rec in result]
+            return records, await result.consume()
+
+        async with self.driver.session() as session:
+            return await session.execute_write(work)
+
+    async def setup_database(self):
+        if self.skip_setup or self.setup_key in CHECKED_SETUPS:
+            return None
+
+        exists = await self._read(CHECK_DB_EXISTS)
+        CHECKED_SETUPS.add(self.setup_key)
+        if exists:
+            return await self.migrate_database()
+
+        print(f"Database empty. Loading initial setup from {self.setup_file_path}...")
+
+        if os.path.exists(self.setup_file_path):
+            async with self.driver.session() as session:
+                for cmd in setup_statements(self.setup_file_path):
+                    await (await session.run(cmd)).consume()
+            print("Initial characters and constraints imported successfully.")
+        else:
+            print(f"Warning: {self.setup_file_path} not found. Proceeding with empty database.")
+
+    # Brings older databases up to date, as ArchersDatabase.migrate_database does
+    async def migrate_database(self):
+        async with self.driver.session() as session:
+            await (await session.run(CREATE_EPISODE_DATE_INDEX)).consume()
+
+        records = await self._read(FIND_EPISODES_WITHOUT_SNAPSHOT)
+        if records:
+            print(f"Backfilling timeline snapshots for {len(records)} episode(s)...")
+            await self.refresh_timeline_snapshots(episode_pids=[rec["pid"] for rec in records])
+
+    async def add_episodes_with_scenes(self, episode_list):
+        formatted_batch = format_episode_batch(episode_list)
+
+        CHUNK_SIZE = 500
+        total_nodes = 0
+
+        for i in range(0, len(formatted_batch), CHUNK_SIZE):
+            chunk = formatted_batch[i:i + CHUNK_SIZE]
+            _, summary = await self._write(ADD_EPISODES_WITH_SCENES, batch=chunk)
+            total_nodes += summary.counters.nodes_created
+
+            if len(formatted_batch) > CHUNK_SIZE:
+                print(f"Progress: {min(i + CHUNK_SIZE, len(formatted_batch))}/{len(formatted_batch)} episodes processed")
+
+        print(f"Added {total_nodes} new node(s) to database.")
+        return total_nodes
+
+    async def handle_duplicate_episodes(self):
+        print("Cleaning up duplicates...")
+
+        # Each cleanup step depends on the previous one having run, so these stay sequential
+        results = {}
+        for key, cypher in CLEANUP_QUERIES.items():
+            records, _ = await self._write(cypher)
+            results[key] = records[0]["count"] if records else 0
+
+        total = sum(results.values())
+        if total > 0:
+            print(f"Cleanup complete: {results}")
+        return total
+
+    async def find_single_scene_episodes(self):
+        records = await self._read(FIND_SINGLE_SCENE_EPISODES)
+        return [rec["pid"] for rec in records]
+
+    # Re-scraped episodes are deleted, their pairs retracted and the new version added
+    # in one transaction, so a failed write leaves the old rows in place
+    async def replace_episodes(self, episode_list):
+        formatted_batch = format_episode_batch(episode_list)
+        pids = [ep["pid"] for ep in formatted_batch]
+
+        async def work(tx):
+            result = await tx.run(FIND_SCENE_CASTS, pids=pids)
+            scene_casts = [rec async for rec in result]
+
+            record = await (await tx.run(DELETE_EPISODES, pids=pids)).single()
+
+            # Retract after deleting so first/last are recomputed without these scenes
+            _, removed, _ = co_appearance_deltas(scene_casts, removed_only=True)
+            if removed:
+                await (await tx.run(REMOVE_CO_APPEARANCES, pairs=removed)).consume()
+
+            summary = await (await tx.run(ADD_EPISODES_WITH_SCENES, batch=formatted_batch)).consume()
+            return (record["count"] if record else 0), summary.counters.nodes_created
+
+        async with self.driver.session() as session:
+            deleted, created = await session.execute_write(work)
+        print(f"Replaced {deleted} re-scraped episode(s) with {created} new node(s).")
+        return deleted
+
+    async def link_all_characters_to_scenes(self, episode_pids=None):
+        pass1_query, pass2_query, params = link_queries(episode_pids)
+
+        print("Pass 1: Linking unambiguous characters...")
+        _, summary = await self._write(pass1_query, **params)
+        pass1_links = summary.counters.relationships_created
+        print(f"Pass 1 complete. Relationships created: {pass1_links}")
+
+        print("Pass 2: Resolving ambiguous characters...")
+        _, summary = await self._write(pass2_query, **params)
+        pass2_links = summary.counters.relationships_created
+        print(f"Pass 2 complete. Relationships created: {pass2_links}")
+
+        total_links = pass1_links + pass2_links
+        print(f"Finished. Total relationships created: {total_links}")
+        return total_links
+
+    async def refresh_timeline_snapshots(self, episode_pids=None):
+        CHUNK_SIZE = 500
+
+        records = await self._read(FIND_TIMELINE_SCENES, pids=episode_pids)
+        snapshots = timeline_snapshots(records)
+
+        # Chunks MERGE FEATURED_IN onto the same popular characters, so write them in turn
+        for i in range(0, len(snapshots), CHUNK_SIZE):
+            await self._write(WRITE_TIMELINE_SNAPSHOTS, batch=snapshots[i:i + CHUNK_SIZE])
+
+        print(f"Refreshed timeline snapshots for {len(snapshots)} episode(s).")
+        return len(snapshots)
+
+    async def update_co_appearances(self, episode_pids):
+        if not await self._read(FIND_COUNTED_SCENE):
+            print("No scenes counted into co-appearances yet; building them from scratch...")
+            return await self.rebuild_co_appearances()
+
+        # The casts, pair deltas and recorded co_cast commit together so a failed write can't desync them
+        async def work(tx):
+            result = await tx.run(FIND_SCENE_CASTS, pids=episode_pids)
+            scene_casts = [rec async for rec in result]
+            added, removed, changed_scenes = co_appearance_deltas(scene_casts)
+
+            # Removals may delete a relationship that ADD would otherwise MERGE onto, so they land first
+            if removed:
+                await (await tx.run(REMOVE_CO_APPEARANCES, pairs=removed)).consume()
+            if added:
+                await (await tx.run(ADD_CO_APPEARANCES, pairs=added)).consume()
+            if changed_scenes:
+                await (await tx.run(SET_SCENE_CASTS, scenes=changed_scenes)).consume()
+            return added, removed, changed_scenes
+
+        async with self.driver.session() as session:
+            added, removed, changed_scenes = await session.execute_write(work)
+
+        print(f"Co-appearances updated from {len(changed_scenes)} scene(s): "
+              f"{len(added)} pair(s) incremented, {len(removed)} decremented.")
+        return len(changed_scenes)
+
+    async def rebuild_co_appearances(self):
+        async def work(tx):
+            record = await (await tx.run(CLEAR_CO_APPEARANCES)).single()
+            cleared = record["count"] if record else 0
+
+            record = await (await tx.run(REBUILD_CO_APPEARANCES)).single()
+            rebuilt = record["count"] if record else 0
+            await (await tx.run(REBUILD_SCENE_CASTS)).consume()
+            return cleared, rebuilt
+
+        async with self.driver.session() as session:
+            cleared, rebuilt = await session.execute_write(work)
+
+        print(f"Rebuilt co-appearances: {rebuilt} pair(s) (previously {cleared}).")
+        return rebuilt
@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+SUBSYSTEMS = ["web_scraper", "database", "async_database", "search_index"]
+# dotenv is left out: every command reads its settings from the environment
+HEAVY_MODULES = {"requests", "bs4", "neo4j"}
+
+# Commands that run end to end offline against a small cache, so each dispatch
+# path's real imports are measured rather than just argparse's --help
+CLI_COMMANDS = {
+    "search": ["archersscrape.py", "search", "ambridge"],
+    "update": ["archersscrape.py", "update", "--from-cache", "--dry-run"],
+}
+# link, cleanup, snapshot and coappear all need a live database and share one
+# import set, so that set is timed directly
+DB_COMMAND_IMPORTS = ["-c", "import archersscrape; import database"]
+
+SAMPLE_EPISODES = [
+    {
+        "pid": f"bench{i:03d}",
+        "date": f"2024-01-{i + 1:02d}",
+        "synopsis": "Rural drama set in Ambridge.",
+        "blurb": "David checks the herd at Brookfield.\nMeanwhile Lynda rehearses the Ambridge panto."
+    }
+    for i in range(20)
+]
+
+
+def write_sample_cache(work_dir):
+    cache_file = os.path.join(work_dir, "cache.json")
+    with open(cache_file, "w") as f:
+        json.dump(SAMPLE_EPISODES, f)
+    return cache_file
+
+
+def run_importtime(args, env):
+    # -X importtime reports "self | cumulative | module" per import on stderr, in microseconds
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=MODULE_DIR, env=env, capture_output=True, text=True
+    )
+
+    total_us = 0
+    modules = set()
+    errors = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        if "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        modules.add(name.strip().split(".")[0])
+
+    output = proc.stdout.splitlines() + errors
+    error = (output[-1] if output else f"exit code {proc.returncode}") if proc.returncode != 0 else None
+    return error, total_us / 1000, modules
+
+
+def best_of(args, runs, env):
+    results = [run_importtime(args, env) for _ in range(runs)]
+    return min(results, key=lambda r: r[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark archersscrape.py startup import time")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per measurement (best is reported)")
+    parser.add_argument('--max-ms', type=float, help="Fail if any command's startup imports exceed this many ms")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = {
+            **os.environ,
+            "CACHE_FILE": write_sample_cache(work_dir),
+            "SEARCH_INDEX_DIR": os.path.join(work_dir, "index"),
+            "RESCRAPE_STATE_FILE": os.path.join(work_dir, "rescrape.json"),
+        }
+        env.pop("SERIES_ID", None)
+
+        # Build the search index once so search runs are timed on the warm path
+        subprocess.run([sys.executable, *CLI_COMMANDS["search"]], cwd=MODULE_DIR, env=env, capture_output=True)
+
+        measurements = list(CLI_COMMANDS.items())
+        measurements.append(("db commands", DB_COMMAND_IMPORTS))
+
+        print(f"{'command':<14}{'imports (ms)':>14}  heavy modules loaded")
+        worst_ms = 0
+        failed = False
+        for name, command in measurements:
+            error, ms, modules = best_of(command, args.runs, env)
+            heavy = sorted(HEAVY_MODULES & modules)
+            if error:
+                failed = True
+                print(f"{name:<14}{'failed':>14}  {error}")
+                continue
+            worst_ms = max(worst_ms, ms)
+            print(f"{name:<14}{ms:>14.1f}  {', '.join(heavy) or '-'}")
+
+        print(f"\n{'subsystem':<16}{'imports (ms)':>10}")
+        for module in SUBSYSTEMS:
+            error, ms, _ = best_of(["-c", f"import {module}"], args.runs, env)
+            print(f"{module:<16}{ms:>10.1f}" if not error else f"{module:<16}{'unavailable':>10}")
+
+    if failed:
+        print("\nSome commands failed, so their startup could not be measured.")
+        sys.exit(1)
+
+    if args.max_ms is not None and worst_ms > args.max_ms:
+        print(f"\nStartup imports took {worst_ms:.1f}ms, over the {args.max_ms:.1f}ms budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
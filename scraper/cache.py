@@ -3,6 +3,36 @@ import json
 from datetime import datetime
 
 
+# The primary (first) series keeps CACHE_FILE itself, so adding series never orphans an existing cache
+def cache_file_for(cache_file, series_id, primary=True):
+    if "{series_id}" in cache_file:
+        return cache_file.format(series_id=series_id)
+    if primary:
+        return cache_file
+
+    root, ext = os.path.splitext(cache_file)
+    return f"{root}_{series_id}{ext}"
+
+
+def env_series_ids():
+    return os.getenv("SERIES_ID", "").replace(",", " ").split()
+
+
+def series_cache_files(series_ids):
+    cache_file = os.getenv("CACHE_FILE")
+    if not cache_file:
+        raise ValueError("CACHE_FILE environment variable is not set")
+
+    if not series_ids:
+        return {None: cache_file}
+    return {sid: cache_file_for(cache_file, sid, primary=(i == 0)) for i, sid in enumerate(series_ids)}
+
+
+def derived_path(cache_file, suffix):
+    root = os.path.splitext(cache_file)[0].replace("{series_id}", "all")
+    return f"{root}_{suffix}"
+
+
 def load_cache(cache_file):
     if not os.path.exists(cache_file):
         return [], None
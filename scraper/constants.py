@@ -0,0 +1,2 @@
+# Empty scenes no longer than this are merged into the previous scene by cleanup --auto
+AUTO_MERGE_MAX_LENGTH = 60
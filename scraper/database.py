@@ -1,40 +1,150 @@
 import os
+import csv
+import json
+from itertools import combinations
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from constants import AUTO_MERGE_MAX_LENGTH
 from queries import (
     CHECK_DB_EXISTS,
-    ADD_EPISODES_WITH_SCENES,
-    CLEANUP_ORPHANS,
-    CLEANUP_EXACT_DUPLICATES,
-    CLEANUP_THIN_REPEATS,
-    CLEANUP_DATE_SHIFTS,
-    LINK_SHARED_TERMS_PREAMBLE,
-    LINK_PASS1_BODY,
-    LINK_PASS2_BODY,
     MANUAL_LINK_CHARACTER,
+    MANUAL_LINK_CHARACTERS_BATCH,
     FIND_EMPTY_SCENES,
     MERGE_SCENES,
-    FIND_SINGLE_SCENE_EPISODES,
-    DELETE_EPISODES,
+    MERGE_SCENES_BATCH,
+    CREATE_EPISODE_DATE_INDEX,
+    FIND_EPISODES_WITHOUT_SNAPSHOT,
+    FIND_TIMELINE_SCENES,
+    WRITE_TIMELINE_SNAPSHOTS,
+    FIND_SCENE_CASTS,
+    FIND_COUNTED_SCENE,
+    ADD_CO_APPEARANCES,
+    REMOVE_CO_APPEARANCES,
+    SET_SCENE_CASTS,
+    CLEAR_CO_APPEARANCES,
+    REBUILD_CO_APPEARANCES,
+    REBUILD_SCENE_CASTS,
 )
 
 load_dotenv()
 
+# Setup checks already done in this process, keyed by (uri, setup file)
+CHECKED_SETUPS = set()
+
+
+def neo4j_credentials():
+    URI = os.getenv("NEO4J_URI")
+    USER = os.getenv("NEO4J_USER")
+    PWD = os.getenv("NEO4J_PASSWORD")
+
+    if not all([URI, USER, PWD]):
+        raise ValueError("Missing Neo4j credentials in .env file")
+    return URI, (USER, PWD)
+
+
+def setup_statements(setup_file_path):
+    with open(setup_file_path, "r") as f:
+        statements = f.read().split(";")
+    return [cmd for cmd in (statement.strip() for statement in statements) if cmd]
+
+
+def timeline_snapshots(records):
+    snapshots = []
+    for rec in records:
+        scenes = rec["scenes"]
+        slugs = {c["slug"] for scene in scenes for c in scene["characters"]}
+        snapshots.append({
+            "pid": rec["pid"],
+            "timeline": json.dumps(scenes),
+            "scene_count": len(scenes),
+            "slugs": sorted(slugs)
+        })
+    return snapshots
+
+
+def scene_episode_pids(scene_ids):
+    return sorted({sid.rsplit("_", 1)[0] for sid in scene_ids})
+
+
+# Resolve chains of empty scenes so each surviving scene gets its final text in one write
+def plan_scene_merges(records, max_length=AUTO_MERGE_MAX_LENGTH):
+    texts = {}
+    roots = {}
+    merges = {}
+    review = []
+
+    for rec in sorted(records, key=lambda r: (r['episode_pid'], r['empty_order'])):
+        texts.setdefault(rec['target_id'], rec['target_text'])
+        texts.setdefault(rec['empty_id'], rec['empty_text'])
+
+        fragment = rec['empty_text'].strip()
+        if len(fragment) <= max_length or fragment[:1].islower():
+            root = roots.get(rec['target_id'], rec['target_id'])
+            roots[rec['empty_id']] = root
+            texts[root] = f"{texts[root]} {texts[rec['empty_id']]}"
+            merges.setdefault(root, {"target_id": root, "episode_pid": rec['episode_pid'], "empty_ids": []})
+            merges[root]["empty_ids"].append(rec['empty_id'])
+        else:
+            review.append(rec)
+
+    for merge in merges.values():
+        merge["text"] = texts[merge["target_id"]]
+
+    review_rows = []
+    for rec in review:
+        target_id = roots.get(rec['target_id'], rec['target_id'])
+        review_rows.append({
+            "episode_pid": rec['episode_pid'],
+            "target_id": target_id,
+            "empty_id": rec['empty_id'],
+            "target_text": texts[target_id],
+            "empty_text": texts[rec['empty_id']],
+        })
+
+    return list(merges.values()), review_rows
+
+
+# Diff each scene's current cast against the cast already counted into CO_APPEARS
+def co_appearance_deltas(scene_casts, removed_only=False):
+    added = {}
+    removed = {}
+    changed_scenes = []
+
+    for rec in scene_casts:
+        cast = set() if removed_only else set(rec["cast"])
+        counted = set(rec["counted"])
+        if cast == counted:
+            continue
+
+        for pair in combinations(sorted(cast), 2):
+            if pair[0] in counted and pair[1] in counted:
+                continue
+            entry = added.setdefault(pair, {"a": pair[0], "b": pair[1], "count": 0, "first": rec["date"], "last": rec["date"]})
+            entry["count"] += 1
+            entry["first"] = min(entry["first"], rec["date"])
+            entry["last"] = max(entry["last"], rec["date"])
+
+        for pair in combinations(sorted(counted), 2):
+            if pair[0] in cast and pair[1] in cast:
+                continue
+            entry = removed.setdefault(pair, {"a": pair[0], "b": pair[1], "count": 0})
+            entry["count"] += 1
+
+        changed_scenes.append({"sid": rec["sid"], "cast": sorted(cast)})
+
+    return list(added.values()), list(removed.values()), changed_scenes
+
 
 class ArchersDatabase:
-    def __init__(self, setup_file="import_base_data.txt"):
+    def __init__(self, setup_file="import_base_data.txt", skip_setup=False):
         module_dir = os.path.dirname(os.path.abspath(__file__))
         self.setup_file_path = os.path.join(module_dir, setup_file)
 
-        URI = os.getenv("NEO4J_URI")
-        USER = os.getenv("NEO4J_USER")
-        PWD = os.getenv("NEO4J_PASSWORD")
-
-        if not all([URI, USER, PWD]):
-            raise ValueError("Missing Neo4j credentials in .env file")
-
-        self.driver = GraphDatabase.driver(URI, auth=(USER, PWD))
-        self.setup_database()
+        uri, auth = neo4j_credentials()
+        self.setup_key = (uri, self.setup_file_path)
+        self.driver = GraphDatabase.driver(uri, auth=auth)
+        if not skip_setup:
+            self.setup_database()
 
     def __enter__(self):
         return self
@@ -44,131 +154,141 @@ class ArchersDatabase:
         return False
 
     def setup_database(self):
+        if self.setup_key in CHECKED_SETUPS: return None
+
         with self.driver.session() as session:
             exists = session.run(CHECK_DB_EXISTS).single()
+            CHECKED_SETUPS.add(self.setup_key)
 
-            if exists is not None: return None
+            if exists is not None: return self.migrate_database()
 
             print(f"Database empty. Loading initial setup from {self.setup_file_path}...")
 
             if os.path.exists(self.setup_file_path):
-                with open(self.setup_file_path, "r") as f:
-                    statements = f.read().split(";")
-
-                    for statement in statements:
-                        cmd = statement.strip()
-                        if cmd:
-                            session.run(cmd)
+                for cmd in setup_statements(self.setup_file_path):
+                    session.run(cmd)
                 print("Initial characters and constraints imported successfully.")
             else:
                 print(f"Warning: {self.setup_file_path} not found. Proceeding with empty database.")
 
+    # Databases loaded before timeline snapshots existed have neither the date index nor snapshots
+    def migrate_database(self):
+        with self.driver.session() as session:
+            session.run(CREATE_EPISODE_DATE_INDEX).consume()
+            pids = [rec["pid"] for rec in session.run(FIND_EPISODES_WITHOUT_SNAPSHOT)]
+
+        if pids:
+            print(f"Backfilling timeline snapshots for {len(pids)} episode(s)...")
+            self.refresh_timeline_snapshots(episode_pids=pids)
+
     def close(self):
         self.driver.close()
 
-    def add_episodes_with_scenes(self, episode_list):
-        formatted_batch = []
-        for ep in episode_list:
-            pid = ep["pid"]
-            formatted_batch.append({
-                "pid": pid,
-                "date": ep["date"],
-                "synopsis": ep["synopsis"],
-                "scenes": [
-                    {
-                        "sid": f"{pid}_{i}",
-                        "index": i,
-                        "text": text
-                    }
-                    for i, text in enumerate(ep["scenes"])
-                ]
-            })
+    def manual_link_character_to_scenes(self, scene_ids, character_name):
+        with self.driver.session() as session:
+            result = session.run(MANUAL_LINK_CHARACTER, char_name=character_name, scene_ids=scene_ids)
+            record = result.single()
+            links = record['links_created'] if record else 0
+
+            if links > 0:
+                print(f"Created {links} link(s) for '{character_name}'.")
+            else:
+                print(f"Warning: No links created. Check if character name or scene IDs exist.")
 
-        CHUNK_SIZE = 500
-        total_nodes = 0
+        if links > 0:
+            self._refresh_linked_scenes(scene_ids)
 
-        with self.driver.session() as session:
-            for i in range(0, len(formatted_batch), CHUNK_SIZE):
-                chunk = formatted_batch[i:i + CHUNK_SIZE]
-                result = session.run(ADD_EPISODES_WITH_SCENES, batch=chunk)
-                summary = result.consume()
-                chunk_nodes = summary.counters.nodes_created
-                total_nodes += chunk_nodes
-
-                if len(formatted_batch) > CHUNK_SIZE:
-                    print(f"Progress: {min(i + CHUNK_SIZE, len(formatted_batch))}/{len(formatted_batch)} episodes processed")
-
-            print(f"Added {total_nodes} new node(s) to database.")
-            return total_nodes
-
-    def handle_duplicate_episodes(self):
-        queries = {
-            "orphans": CLEANUP_ORPHANS,
-            "exact_duplicates": CLEANUP_EXACT_DUPLICATES,
-            "thin_repeats": CLEANUP_THIN_REPEATS,
-            "date_shifts": CLEANUP_DATE_SHIFTS,
-        }
-
-        print("Cleaning up duplicates...")
-
-        results = {}
-        with self.driver.session() as session:
-            for key, cypher in queries.items():
-                res = session.run(cypher).single()
-                results[key] = res["count"] if res else 0
+    def manual_link_characters_from_file(self, link_file):
+        with open(link_file, newline="") as f:
+            reader = csv.DictReader(f)
+            if not {"character", "scene"} <= set(reader.fieldnames or []):
+                raise ValueError(f"{link_file} must have 'character' and 'scene' columns")
+            pairs = [
+                {"character": row["character"].strip(), "scene": row["scene"].strip()}
+                for row in reader
+                if row["character"] and row["scene"]
+            ]
 
-        total = sum(results.values())
-        if total > 0:
-            print(f"Cleanup complete: {results}")
-        return total
+        if not pairs:
+            print(f"No character/scene pairs found in {link_file}.")
+            return 0
 
-    def find_single_scene_episodes(self):
-        with self.driver.session() as session:
-            records = list(session.run(FIND_SINGLE_SCENE_EPISODES))
-            return [rec["pid"] for rec in records]
+        CHUNK_SIZE = 5000
+        links = 0
 
-    def delete_episodes(self, pids):
         with self.driver.session() as session:
-            result = session.run(DELETE_EPISODES, pids=pids)
-            record = result.single()
-            count = record["count"] if record else 0
-            print(f"Deleted {count} episode(s) for re-scrape.")
-            return count
+            for i in range(0, len(pairs), CHUNK_SIZE):
+                record = session.run(MANUAL_LINK_CHARACTERS_BATCH, pairs=pairs[i:i + CHUNK_SIZE]).single()
+                links += record['links_created'] if record else 0
 
-    def link_all_characters_to_scenes(self, episode_pids=None):
-        pid_filter = "AND e.pid IN $pids" if episode_pids is not None else ""
+        print(f"Linked {links} of {len(pairs)} character/scene pair(s) from {link_file}.")
+        if links < len(pairs):
+            print(f"Warning: {len(pairs) - links} pair(s) skipped. Check if character names or scene IDs exist.")
 
-        pass1_query = LINK_SHARED_TERMS_PREAMBLE + LINK_PASS1_BODY.format(pid_filter=pid_filter)
-        pass2_query = LINK_SHARED_TERMS_PREAMBLE + LINK_PASS2_BODY.format(pid_filter=pid_filter)
+        if links > 0:
+            self._refresh_linked_scenes([pair["scene"] for pair in pairs])
+        return links
+
+    def _refresh_linked_scenes(self, scene_ids):
+        episode_pids = scene_episode_pids(scene_ids)
+        self.update_co_appearances(episode_pids=episode_pids)
+        self.refresh_timeline_snapshots(episode_pids=episode_pids)
+
+    def refresh_timeline_snapshots(self, episode_pids=None):
+        CHUNK_SIZE = 500
 
         with self.driver.session() as session:
-            params = {'pids': episode_pids} if episode_pids is not None else {}
+            records = list(session.run(FIND_TIMELINE_SCENES, pids=episode_pids))
 
-            print("Pass 1: Linking unambiguous characters...")
-            result = session.run(pass1_query, **params)
-            pass1_links = result.consume().counters.relationships_created
-            print(f"Pass 1 complete. Relationships created: {pass1_links}")
+            snapshots = timeline_snapshots(records)
+            for i in range(0, len(snapshots), CHUNK_SIZE):
+                session.run(WRITE_TIMELINE_SNAPSHOTS, batch=snapshots[i:i + CHUNK_SIZE]).consume()
 
-            print("Pass 2: Resolving ambiguous characters...")
-            result = session.run(pass2_query, **params)
-            pass2_links = result.consume().counters.relationships_created
-            print(f"Pass 2 complete. Relationships created: {pass2_links}")
+            print(f"Refreshed timeline snapshots for {len(snapshots)} episode(s).")
+            return len(snapshots)
 
-            total_links = pass1_links + pass2_links
-            print(f"Finished. Total relationships created: {total_links}")
-            return total_links
+    def update_co_appearances(self, episode_pids):
+        with self.driver.session() as session:
+            counted = session.run(FIND_COUNTED_SCENE).single()
+        if counted is None:
+            print("No scenes counted into co-appearances yet; building them from scratch...")
+            return self.rebuild_co_appearances()
+
+        # The casts, pair deltas and recorded co_cast commit together so a failed write can't desync them
+        def work(tx):
+            scene_casts = list(tx.run(FIND_SCENE_CASTS, pids=episode_pids))
+            added, removed, changed_scenes = co_appearance_deltas(scene_casts)
+
+            if removed:
+                tx.run(REMOVE_CO_APPEARANCES, pairs=removed).consume()
+            if added:
+                tx.run(ADD_CO_APPEARANCES, pairs=added).consume()
+            if changed_scenes:
+                tx.run(SET_SCENE_CASTS, scenes=changed_scenes).consume()
+            return added, removed, changed_scenes
 
-    def manual_link_character_to_scenes(self, scene_ids, character_name):
         with self.driver.session() as session:
-            result = session.run(MANUAL_LINK_CHARACTER, char_name=character_name, scene_ids=scene_ids)
-            record = result.single()
-            links = record['links_created'] if record else 0
+            added, removed, changed_scenes = session.execute_write(work)
 
-            if links > 0:
-                print(f"Created {links} link(s) for '{character_name}'.")
-            else:
-                print(f"Warning: No links created. Check if character name or scene IDs exist.")
+        print(f"Co-appearances updated from {len(changed_scenes)} scene(s): "
+              f"{len(added)} pair(s) incremented, {len(removed)} decremented.")
+        return len(changed_scenes)
+
+    def rebuild_co_appearances(self):
+        def work(tx):
+            record = tx.run(CLEAR_CO_APPEARANCES).single()
+            cleared = record["count"] if record else 0
+
+            record = tx.run(REBUILD_CO_APPEARANCES).single()
+            rebuilt = record["count"] if record else 0
+            tx.run(REBUILD_SCENE_CASTS).consume()
+            return cleared, rebuilt
+
+        with self.driver.session() as session:
+            cleared, rebuilt = session.execute_write(work)
 
+        print(f"Rebuilt co-appearances: {rebuilt} pair(s) (previously {cleared}).")
+        return rebuilt
 
     def cleanup_empty_scenes(self):
         with self.driver.session() as session:
@@ -178,6 +298,7 @@ class ArchersDatabase:
                 print("No empty scenes with predecessors found.")
                 return
 
+            merged_pids = set()
             for i, rec in enumerate(records):
                 print(f"\n--- Match {i+1} of {len(records)} ---")
                 print(f"PREVIOUS SCENE ({rec['target_id']}): {rec['target_text']}")
@@ -187,6 +308,39 @@ class ArchersDatabase:
 
                 if choice == 'y':
                     session.run(MERGE_SCENES, target_id=rec['target_id'], empty_id=rec['empty_id'])
+                    merged_pids.add(rec['episode_pid'])
                     print(f"Merged scene {rec['empty_id']}.")
                 else:
                     print("Skipped.")
+
+        if merged_pids:
+            self.refresh_timeline_snapshots(episode_pids=sorted(merged_pids))
+
+    def auto_cleanup_empty_scenes(self, review_file, max_length=AUTO_MERGE_MAX_LENGTH):
+        with self.driver.session() as session:
+            records = list(session.run(FIND_EMPTY_SCENES))
+
+            if not records:
+                print("No empty scenes with predecessors found.")
+                return 0
+
+            merges, review_rows = plan_scene_merges(records, max_length=max_length)
+
+            CHUNK_SIZE = 500
+            merged = 0
+            for i in range(0, len(merges), CHUNK_SIZE):
+                record = session.run(MERGE_SCENES_BATCH, merges=merges[i:i + CHUNK_SIZE]).single()
+                merged += record["count"] if record else 0
+
+        print(f"Merged {merged} of {len(records)} empty scene(s).")
+
+        if review_rows:
+            with open(review_file, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=["episode_pid", "target_id", "empty_id", "target_text", "empty_text"])
+                writer.writeheader()
+                writer.writerows(review_rows)
+            print(f"Wrote {len(review_rows)} scene(s) for manual review to {review_file}.")
+
+        if merges:
+            self.refresh_timeline_snapshots(episode_pids=sorted({m["episode_pid"] for m in merges}))
+        return merged
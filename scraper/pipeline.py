@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+from contextlib import AsyncExitStack
+
+from processor import process_batch
+from cache import load_cache, series_cache_files, env_series_ids
+from rescrape_schedule import RescrapeSchedule, state_file_for
+
+
+MAX_SHARED_WORKERS = 15
+
+
+def scrape_episodes(series_id, cache_file, cached_data, last_cached_date, scraper):
+    if not last_cached_date:
+        print(f"[{series_id}] No cache found. Performing full scrape...")
+        episodes = scraper.get_all_episodes(series_id)
+        with open(cache_file, "w") as f:
+            json.dump(episodes, f)
+        return episodes
+
+    print(f"[{series_id}] Searching for episodes newer than {last_cached_date}...")
+    new_episodes = []
+    current_page = 1
+    found_overlap = False
+
+    while not found_overlap:
+        print(f"[{series_id}] Checking page {current_page}...")
+        page_results = scraper.get_paginated_episodes(series_id, first_page=current_page, last_page=current_page)
+
+        if not page_results:
+            break
+
+        for ep in page_results:
+            ep_date = datetime.strptime(ep['date'], "%Y-%m-%d").date()
+            if ep_date > last_cached_date:
+                new_episodes.append(ep)
+            else:
+                found_overlap = True
+                break
+
+        if not found_overlap:
+            current_page += 1
+
+    if new_episodes:
+        print(f"[{series_id}] Found {len(new_episodes)} new episode(s).")
+        with open(cache_file, "w") as f:
+            json.dump(new_episodes + cached_data, f)
+    else:
+        print(f"[{series_id}] No new episodes found.")
+
+    return new_episodes
+
+
+# Returns the changed episodes and the schedule recording them; the caller replaces the
+# episodes and then saves the schedule, so a failed write is retried next run
+async def rescrape_single_scene_episodes(db, scraper, state_file, cached_data, dry_run=False):
+    pids = await db.find_single_scene_episodes()
+    if not pids:
+        return [], None
+
+    schedule = RescrapeSchedule(state_file)
+    due_pids = schedule.due(pids)
+    if not due_pids:
+        print(f"Found {len(pids)} recent episode(s) with only 1 scene — none due for re-scrape.")
+        if not dry_run:
+            schedule.save()
+        return [], None
+
+    print(f"Found {len(pids)} recent episode(s) with only 1 scene — re-scraping {len(due_pids)} due...")
+    fetched = {ep['pid']: ep for ep in await asyncio.to_thread(scraper.get_episodes, due_pids)}
+    cached = {ep['pid']: ep for ep in cached_data}
+
+    episodes = [
+        fetched[pid] for pid in due_pids
+        if schedule.record(pid, fetched.get(pid), baseline=cached.get(pid))
+    ]
+    print(f"{len(episodes)} re-scraped episode(s) changed, {len(due_pids) - len(episodes)} unchanged.")
+
+    return episodes, (None if dry_run else schedule)
+
+
+async def update_db(series_ids=None, from_cache=False, dry_run=False, skip_setup=False):
+    start_time = time.perf_counter()
+
+    series_ids = series_ids or env_series_ids()
+    if not from_cache and not series_ids:
+        raise ValueError("SERIES_ID environment variable is not set (required when not using --from-cache)")
+
+    cache_files = series_cache_files(series_ids)
+    caches = {sid: load_cache(path) for sid, path in cache_files.items()}
+    cached_data = [ep for data, _ in caches.values() for ep in data]
+
+    if from_cache and not cached_data:
+        print("Error: No cache file found to reset from.")
+        return
+
+    async with AsyncExitStack() as stack:
+        scraper = None
+        if not from_cache:
+            from web_scraper import WebScraper, MAX_WORKERS
+            workers = min(MAX_WORKERS * len(cache_files), MAX_SHARED_WORKERS)
+            scraper = stack.enter_context(WebScraper(max_workers=workers))
+
+        # A dry run from cache touches neither the network nor the database
+        db = None
+        if not (from_cache and dry_run):
+            from async_database import AsyncArchersDatabase
+            db = await stack.enter_async_context(AsyncArchersDatabase(skip_setup=skip_setup))
+
+        async def scrape_all():
+            if from_cache:
+                return list({ep['pid']: ep for ep in cached_data}.values())
+
+            # Each series walks its own index, but every fetch goes through the shared pool
+            scrape_start = time.perf_counter()
+            results = await asyncio.gather(*(
+                asyncio.to_thread(scrape_episodes, sid, cache_files[sid], *caches[sid], scraper)
+                for sid in cache_files
+            ))
+            print(f"Scraping completed in {time.perf_counter() - scrape_start:.2f}s")
+            return list({ep['pid']: ep for episodes in results for ep in episodes}.values())
+
+        async def prepare_db():
+            if db is None:
+                return [], None
+
+            await db.setup_database()
+            if from_cache:
+                return [], None
+
+            # Re-scrape recent episodes that only had 1 scene (incomplete blurb)
+            state_file = state_file_for(os.getenv("CACHE_FILE"))
+            return await rescrape_single_scene_episodes(db, scraper, state_file, cached_data, dry_run=dry_run)
+
+        # The schema check and re-scrape fetch run while the series indexes are being fetched;
+        # nothing is written until processing succeeds
+        episodes_to_process, (rescraped, schedule) = await asyncio.gather(scrape_all(), prepare_db())
+
+        existing_pids = {ep['pid'] for ep in episodes_to_process}
+        for ep in rescraped:
+            if ep['pid'] not in existing_pids:
+                episodes_to_process.append(ep)
+
+        if not episodes_to_process:
+            if schedule:
+                schedule.save()
+            print("No episodes to process.")
+            return
+
+        process_start = time.perf_counter()
+        print(f"Processing {len(episodes_to_process)} episodes...")
+        detailed_episode_data = process_batch(episodes_to_process)
+        print(f"Processing completed in {time.perf_counter() - process_start:.2f}s")
+
+        if not detailed_episode_data:
+            return
+
+        if dry_run:
+            total_scenes = sum(len(ep['scenes']) for ep in detailed_episode_data)
+            dates = [ep['date'] for ep in detailed_episode_data]
+            print(f"\n--- DRY RUN SUMMARY ---")
+            print(f"Episodes to process: {len(detailed_episode_data)}")
+            print(f"Date range: {min(dates)} to {max(dates)}")
+            print(f"Total scenes: {total_scenes}")
+            print(f"Average scenes per episode: {total_scenes / len(detailed_episode_data):.1f}")
+            print(f"Dry run completed in {time.perf_counter() - start_time:.2f}s")
+            return
+
+        upsert_start = time.perf_counter()
+        rescrape_pids = {ep['pid'] for ep in rescraped}
+        replaced = [ep for ep in detailed_episode_data if ep['pid'] in rescrape_pids]
+        added = [ep for ep in detailed_episode_data if ep['pid'] not in rescrape_pids]
+        if replaced:
+            await db.replace_episodes(replaced)
+        if added:
+            await db.add_episodes_with_scenes(added)
+        if schedule:
+            schedule.save()
+        print(f"Database upsert completed in {time.perf_counter() - upsert_start:.2f}s")
+
+        cleaned = 0
+        if from_cache or len(detailed_episode_data) > 10:
+            cleanup_start = time.perf_counter()
+            cleaned = await db.handle_duplicate_episodes()
+            print(f"Cleanup completed in {time.perf_counter() - cleanup_start:.2f}s")
+
+        link_start = time.perf_counter()
+        new_pids = [ep['pid'] for ep in detailed_episode_data]
+        await db.link_all_characters_to_scenes(episode_pids=new_pids)
+        print(f"Character linking completed in {time.perf_counter() - link_start:.2f}s")
+
+        # Both steps create relationships on the same Character nodes, so they run one after the other
+        co_start = time.perf_counter()
+        if cleaned:
+            # Cleanup deletes scenes server-side, so their counted pairs can't be retracted incrementally
+            await db.rebuild_co_appearances()
+        else:
+            await db.update_co_appearances(episode_pids=new_pids)
+        print(f"Co-appearance update completed in {time.perf_counter() - co_start:.2f}s")
+
+        snapshot_start = time.perf_counter()
+        await db.refresh_timeline_snapshots(episode_pids=new_pids)
+        print(f"Timeline snapshots completed in {time.perf_counter() - snapshot_start:.2f}s")
+
+    print(f"\nTotal update time: {time.perf_counter() - start_time:.2f}s")
@@ -223,12 +223,20 @@ MERGE (c)-[r:APPEARS_IN]->(s)
 RETURN count(r) AS links_created
 """
 
+MANUAL_LINK_CHARACTERS_BATCH = """
+UNWIND $pairs AS pair
+MATCH (c:Character {name: pair.character})
+MATCH (s:Scene {id: pair.scene})
+MERGE (c)-[r:APPEARS_IN]->(s)
+RETURN count(r) AS links_created
+"""
+
 FIND_EMPTY_SCENES = """
 MATCH (e:Episode)<-[:PART_OF]-(empty:Scene)
 WHERE NOT (empty)<-[:APPEARS_IN]-(:Character)
 MATCH (target:Scene)-[:PART_OF]->(e)
 WHERE target.order = empty.order - 1
-RETURN empty.id AS empty_id, empty.text AS empty_text,
+RETURN empty.id AS empty_id, empty.text AS empty_text, empty.order AS empty_order,
     target.id AS target_id, target.text AS target_text,
     e.pid AS episode_pid
 ORDER BY empty.id ASC
@@ -241,6 +249,17 @@ SET target.text = target.text + " " + empty.text
 DETACH DELETE empty
 """
 
+MERGE_SCENES_BATCH = """
+UNWIND $merges AS m
+MATCH (target:Scene {id: m.target_id})
+SET target.text = m.text
+WITH m
+UNWIND m.empty_ids AS empty_id
+MATCH (empty:Scene {id: empty_id})
+DETACH DELETE empty
+RETURN count(empty) AS count
+"""
+
 FIND_SINGLE_SCENE_EPISODES = """
 MATCH (s:Scene)-[:PART_OF]->(e:Episode)
 WHERE e.date >= date() - duration({days: 7})
@@ -256,3 +275,116 @@ OPTIONAL MATCH (s:Scene)-[:PART_OF]->(e)
 DETACH DELETE s, e
 RETURN count(e) AS count
 """
+
+CREATE_EPISODE_DATE_INDEX = "CREATE INDEX episode_date IF NOT EXISTS FOR (e:Episode) ON (e.date)"
+
+FIND_EPISODES_WITHOUT_SNAPSHOT = """
+// Episodes loaded before timeline snapshots existed, or whose snapshot write never landed
+MATCH (e:Episode)
+WHERE e.scene_count IS NULL
+RETURN e.pid AS pid
+"""
+
+FIND_TIMELINE_SCENES = """
+MATCH (e:Episode)
+WHERE $pids IS NULL OR e.pid IN $pids
+OPTIONAL MATCH (s:Scene)-[:PART_OF]->(e)
+OPTIONAL MATCH (c:Character)-[:APPEARS_IN]->(s)
+WITH e, s, [x IN collect(DISTINCT {
+    name: c.name,
+    slug: c.slug
+}) WHERE x.slug IS NOT NULL] AS characters
+ORDER BY s.id ASC
+RETURN e.pid AS pid,
+    [x IN collect({
+        sceneId: s.id,
+        text: s.text,
+        characters: characters
+    }) WHERE x.sceneId IS NOT NULL] AS scenes
+"""
+
+WRITE_TIMELINE_SNAPSHOTS = """
+UNWIND $batch AS snap
+MATCH (e:Episode {pid: snap.pid})
+SET e.timeline = snap.timeline,
+    e.scene_count = snap.scene_count
+WITH e, snap
+CALL (e) {
+    MATCH (:Character)-[f:FEATURED_IN]->(e)
+    DELETE f
+}
+WITH e, snap
+UNWIND snap.slugs AS slug
+MATCH (c:Character {slug: slug})
+MERGE (c)-[:FEATURED_IN]->(e)
+"""
+
+FIND_SCENE_CASTS = """
+MATCH (s:Scene)-[:PART_OF]->(e:Episode)
+WHERE e.pid IN $pids
+OPTIONAL MATCH (c:Character)-[:APPEARS_IN]->(s)
+WITH s, e, collect(DISTINCT c.slug) AS cast
+RETURN s.id AS sid, e.date AS date, coalesce(s.co_cast, []) AS counted, cast
+"""
+
+FIND_COUNTED_SCENE = """
+// Scenes carry co_cast once counted into CO_APPEARS; none means the aggregate was never built
+MATCH (s:Scene)
+WHERE s.co_cast IS NOT NULL
+RETURN s.id AS sid
+LIMIT 1
+"""
+
+ADD_CO_APPEARANCES = """
+UNWIND $pairs AS p
+MATCH (a:Character {slug: p.a})
+MATCH (b:Character {slug: p.b})
+MERGE (a)-[r:CO_APPEARS]->(b)
+ON CREATE SET r.count = 0
+SET r.count = r.count + p.count,
+    r.first = CASE WHEN r.first IS NULL OR p.first < r.first THEN p.first ELSE r.first END,
+    r.last = CASE WHEN r.last IS NULL OR p.last > r.last THEN p.last ELSE r.last END
+"""
+
+REMOVE_CO_APPEARANCES = """
+UNWIND $pairs AS p
+MATCH (a:Character {slug: p.a})-[r:CO_APPEARS]->(b:Character {slug: p.b})
+SET r.count = r.count - p.count
+
+// Recompute first/last from the scenes the pair still shares; drop exhausted pairs
+WITH a, b, r
+OPTIONAL MATCH (a)-[:APPEARS_IN]->(s:Scene)<-[:APPEARS_IN]-(b)
+OPTIONAL MATCH (s)-[:PART_OF]->(e:Episode)
+WITH r, r.count <= 0 AS exhausted, min(e.date) AS first, max(e.date) AS last
+FOREACH (_ IN CASE WHEN exhausted THEN [1] ELSE [] END | DELETE r)
+FOREACH (_ IN CASE WHEN NOT exhausted THEN [1] ELSE [] END |
+    SET r.first = first, r.last = last)
+"""
+
+SET_SCENE_CASTS = """
+UNWIND $scenes AS sc
+MATCH (s:Scene {id: sc.sid})
+SET s.co_cast = sc.cast
+"""
+
+CLEAR_CO_APPEARANCES = """
+MATCH (:Character)-[r:CO_APPEARS]->(:Character)
+DELETE r
+RETURN count(r) AS count
+"""
+
+REBUILD_CO_APPEARANCES = """
+MATCH (a:Character)-[:APPEARS_IN]->(s:Scene)<-[:APPEARS_IN]-(b:Character)
+WHERE a.slug < b.slug
+MATCH (s)-[:PART_OF]->(e:Episode)
+WITH a, b, count(DISTINCT s) AS n, min(e.date) AS first, max(e.date) AS last
+CREATE (a)-[r:CO_APPEARS {count: n, first: first, last: last}]->(b)
+RETURN count(r) AS count
+"""
+
+REBUILD_SCENE_CASTS = """
+MATCH (s:Scene)
+OPTIONAL MATCH (c:Character)-[:APPEARS_IN]->(s)
+WITH s, collect(DISTINCT c.slug) AS cast
+SET s.co_cast = cast
+"""
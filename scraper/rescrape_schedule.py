@@ -0,0 +1,71 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+
+from cache import derived_path
+
+BASE_INTERVAL = timedelta(hours=4)
+MAX_INTERVAL = timedelta(hours=48)
+
+
+def content_hash(episode):
+    payload = json.dumps(episode, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def state_file_for(cache_file):
+    return os.getenv("RESCRAPE_STATE_FILE") or derived_path(cache_file, "rescrape.json")
+
+
+class RescrapeSchedule:
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.state = {}
+
+        if os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                self.state = json.load(f)
+
+    def save(self):
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def due(self, pids, now=None):
+        now = now or datetime.now()
+
+        # Episodes that left the window (or gained scenes) no longer need tracking
+        self.state = {pid: entry for pid, entry in self.state.items() if pid in pids}
+
+        due_pids = []
+        for pid in pids:
+            entry = self.state.get(pid)
+            if entry is None:
+                due_pids.append(pid)
+                continue
+
+            interval = min(BASE_INTERVAL * (2 ** entry["unchanged"]), MAX_INTERVAL)
+            if now - datetime.fromisoformat(entry["fetched_at"]) >= interval:
+                due_pids.append(pid)
+
+        return due_pids
+
+    def record(self, pid, episode, baseline=None, now=None):
+        now = now or datetime.now()
+        entry = self.state.get(pid)
+
+        previous_hash = entry["hash"] if entry else (content_hash(baseline) if baseline else None)
+        unchanged = entry["unchanged"] if entry else 0
+
+        # A failed fetch counts as unchanged so a broken page backs off too
+        new_hash = content_hash(episode) if episode else previous_hash
+        changed = episode is not None and new_hash != previous_hash
+
+        self.state[pid] = {
+            "fetched_at": now.isoformat(timespec="seconds"),
+            "hash": new_hash,
+            "unchanged": 0 if changed else unchanged + 1,
+        }
+        return changed
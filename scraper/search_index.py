@@ -0,0 +1,337 @@
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from processor import process_batch
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+CHARACTER_PATTERN = re.compile(r'\(\w+:Character \{name: "([^"]+)"([^}]*)\}\)')
+ALIASES_PATTERN = re.compile(r'aliases: \[([^\]]*)\]')
+
+MANIFEST_FILE = "manifest.json"
+INDEX_VERSION = 1
+MAX_SEGMENTS = 8
+
+# Lexicon entry: word offset, word length, postings offset, postings count
+LEX_RECORD = struct.Struct("<QIQI")
+# Doc entry: store offset, store length, date ordinal, episode index
+DOC_RECORD = struct.Struct("<QIII")
+# Posting entry: native-endian uint32 doc, position; grouped by term, sorted by doc
+POSTING_RECORD = struct.Struct("=II")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def episode_hash(episode):
+    payload = json.dumps([episode["date"], episode["scenes"]])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_characters(setup_file="import_base_data.txt"):
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    setup_file_path = os.path.join(module_dir, setup_file)
+    if not os.path.exists(setup_file_path):
+        return []
+
+    with open(setup_file_path, "r") as f:
+        setup = f.read()
+
+    characters = []
+    for match in CHARACTER_PATTERN.finditer(setup):
+        aliases_match = ALIASES_PATTERN.search(match.group(2))
+        aliases = re.findall(r'"([^"]+)"', aliases_match.group(1)) if aliases_match else []
+        characters.append({"name": match.group(1), "aliases": aliases})
+    return characters
+
+
+def character_phrases(name, characters):
+    wanted = name.lower()
+    phrases = []
+    for c in characters:
+        terms = [c["name"]] + c["aliases"]
+        if wanted in (t.lower() for t in terms):
+            phrases.extend(t for t in terms if t not in phrases)
+    return phrases or [name]
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _RecordView:
+    # Sequence over a fixed-width record file, so bisect can search it in place
+    def __init__(self, buf, record, field, offset=0, count=None):
+        self.buf = buf
+        self.record = record
+        self.field = field
+        self.offset = offset
+        self.count = len(buf) // record.size if count is None else count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.record.unpack_from(self.buf, self.offset + i * self.record.size)[self.field]
+
+
+class _WordView(_RecordView):
+    def __init__(self, lex, words):
+        super().__init__(lex, LEX_RECORD, 0)
+        self.words = words
+
+    def __getitem__(self, i):
+        offset, length, _, _ = LEX_RECORD.unpack_from(self.buf, i * LEX_RECORD.size)
+        return self.words[offset:offset + length]
+
+
+class Segment:
+    def __init__(self, index_dir, name):
+        base = os.path.join(index_dir, name)
+        self.name = name
+        self.lex = _map_file(base + ".lex")
+        self.words = _map_file(base + ".words")
+        self.postings = _map_file(base + ".post")
+        self.docs = _map_file(base + ".docs")
+        self.store = _map_file(base + ".store")
+        with open(base + ".pids", "r") as f:
+            self.pids = json.load(f)
+
+        self.word_view = _WordView(self.lex, self.words)
+        self.date_view = _RecordView(self.docs, DOC_RECORD, 2)
+
+    def close(self):
+        for buf in (self.lex, self.words, self.postings, self.docs, self.store):
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    def __len__(self):
+        return len(self.date_view)
+
+    def term_postings(self, term, lo, hi):
+        # Only the term's postings for docs in [lo, hi) are read off the map
+        key = term.encode("utf-8")
+        i = bisect_left(self.word_view, key)
+        pairs = array("I")
+        if i == len(self.word_view) or self.word_view[i] != key:
+            return pairs
+
+        _, _, offset, count = LEX_RECORD.unpack_from(self.lex, i * LEX_RECORD.size)
+        doc_view = _RecordView(self.postings, POSTING_RECORD, 0, offset, count)
+        start = offset + bisect_left(doc_view, lo) * POSTING_RECORD.size
+        end = offset + bisect_left(doc_view, hi) * POSTING_RECORD.size
+        pairs.frombytes(self.postings[start:end])
+        return pairs
+
+    def date_range(self, from_date=None, to_date=None):
+        lo = bisect_left(self.date_view, from_date.toordinal()) if from_date else 0
+        hi = bisect_right(self.date_view, to_date.toordinal()) if to_date else len(self)
+        return lo, hi
+
+    def doc(self, doc_id):
+        offset, length, _, _ = DOC_RECORD.unpack_from(self.docs, doc_id * DOC_RECORD.size)
+        return json.loads(self.store[offset:offset + length])
+
+    def doc_pid(self, doc_id):
+        _, _, _, pid_index = DOC_RECORD.unpack_from(self.docs, doc_id * DOC_RECORD.size)
+        return self.pids[pid_index]
+
+
+class _Phrase:
+    # A phrase's postings within one segment's date range. Docs holding every token are
+    # found up front; adjacency is only checked for the docs a search actually reaches
+    def __init__(self, segment, tokens, lo, hi):
+        self.postings = [segment.term_postings(t, lo, hi) for t in tokens]
+        self.doc_ids = [pairs[0::2] for pairs in self.postings]
+
+        self.docs = set(self.doc_ids[0]) if tokens else set()
+        for ids in self.doc_ids[1:]:
+            self.docs.intersection_update(ids)
+
+    def _positions(self, k, doc):
+        i = bisect_left(self.doc_ids[k], doc)
+        j = bisect_right(self.doc_ids[k], doc)
+        return self.postings[k][2 * i + 1:2 * j:2]
+
+    def matches(self, doc):
+        if doc not in self.docs:
+            return False
+        if len(self.postings) == 1:
+            return True
+
+        following = [set(self._positions(k, doc)) for k in range(1, len(self.postings))]
+        return any(
+            all(start + k + 1 in positions for k, positions in enumerate(following))
+            for start in self._positions(0, doc)
+        )
+
+
+def write_segment(index_dir, name, episodes):
+    base = os.path.join(index_dir, name)
+    scenes = sorted(
+        (
+            (ep["date"], ep["pid"], i, text)
+            for ep in episodes
+            for i, text in enumerate(ep["scenes"])
+        ),
+        key=lambda x: (x[0], x[1], x[2])
+    )
+
+    pids = sorted({ep["pid"] for ep in episodes})
+    pid_index = {pid: i for i, pid in enumerate(pids)}
+    inverted = {}
+
+    with open(base + ".store", "wb") as store, open(base + ".docs", "wb") as docs:
+        for doc_id, (ep_date, pid, i, text) in enumerate(scenes):
+            record = json.dumps({"sid": f"{pid}_{i}", "pid": pid, "date": ep_date, "text": text}).encode("utf-8")
+            docs.write(DOC_RECORD.pack(store.tell(), len(record), date.fromisoformat(ep_date).toordinal(), pid_index[pid]))
+            store.write(record)
+
+            for pos, token in enumerate(tokenize(text)):
+                inverted.setdefault(token.encode("utf-8"), array("I")).extend((doc_id, pos))
+
+    with open(base + ".lex", "wb") as lex, open(base + ".words", "wb") as words, open(base + ".post", "wb") as post:
+        for word in sorted(inverted):
+            pairs = inverted[word]
+            lex.write(LEX_RECORD.pack(words.tell(), len(word), post.tell(), len(pairs) // 2))
+            words.write(word)
+            pairs.tofile(post)
+
+    with open(base + ".pids", "w") as f:
+        json.dump(pids, f)
+
+
+class SearchIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        self.manifest = self._load_manifest()
+        self.segments = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        for segment in self.segments or []:
+            segment.close()
+        self.segments = None
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == INDEX_VERSION:
+                return manifest
+
+        return {"version": INDEX_VERSION, "source": None, "next_segment": 0, "segments": [], "episodes": {}}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _remove_segment(self, name):
+        for ext in (".lex", ".words", ".post", ".docs", ".store", ".pids"):
+            path = os.path.join(self.index_dir, name + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _source(cache_files):
+        return [[path, os.stat(path).st_mtime_ns, os.stat(path).st_size] for path in sorted(cache_files)]
+
+    def is_current(self, cache_files):
+        return self.manifest["source"] == self._source(cache_files)
+
+    def update(self, cache_files, cached_data, rebuild=False):
+        self.close()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        processed = process_batch(cached_data)
+        current = {ep["pid"]: (ep, episode_hash(ep)) for ep in processed}
+        indexed = self.manifest["episodes"]
+
+        if rebuild or len(self.manifest["segments"]) >= MAX_SEGMENTS:
+            indexed.clear()
+
+        changed = [ep for pid, (ep, h) in current.items() if indexed.get(pid, [None, None])[1] != h]
+        removed = [pid for pid in indexed if pid not in current]
+        for pid in removed:
+            del indexed[pid]
+
+        if changed:
+            name = f"seg-{self.manifest['next_segment']:05d}"
+            self.manifest["next_segment"] += 1
+            write_segment(self.index_dir, name, changed)
+            self.manifest["segments"].append(name)
+            for ep in changed:
+                indexed[ep["pid"]] = [name, current[ep["pid"]][1]]
+
+        live = {seg for seg, _ in indexed.values()}
+        for name in [s for s in self.manifest["segments"] if s not in live]:
+            self.manifest["segments"].remove(name)
+            self._remove_segment(name)
+
+        self.manifest["source"] = self._source(cache_files)
+        self._save_manifest()
+
+        print(f"Search index updated: {len(changed)} episode(s) indexed, {len(removed)} removed, "
+              f"{len(self.manifest['segments'])} segment(s).")
+        return len(changed)
+
+    def _open_segments(self):
+        if self.segments is None:
+            self.segments = [Segment(self.index_dir, name) for name in self.manifest["segments"]]
+        return self.segments
+
+    def search(self, terms=(), phrases=(), characters=(), from_date=None, to_date=None, limit=20):
+        term_tokens = [t for term in terms for t in tokenize(term)]
+        phrase_tokens = [tokenize(p) for p in phrases]
+        character_tokens = [[tokenize(p) for p in c] for c in characters]
+
+        results = []
+        for segment in self._open_segments():
+            lo, hi = segment.date_range(from_date, to_date)
+            if lo >= hi:
+                continue
+
+            # Each group of alternatives must match; a plain term is a one-token phrase
+            groups = [[_Phrase(segment, [t], lo, hi)] for t in term_tokens]
+            groups += [[_Phrase(segment, tokens, lo, hi)] for tokens in phrase_tokens]
+            groups += [[_Phrase(segment, tokens, lo, hi) for tokens in c] for c in character_tokens]
+
+            docs = None
+            for phrases in groups:
+                matched = set().union(*(p.docs for p in phrases))
+                docs = matched if docs is None else docs & matched
+
+            # Docs are in date order, so walk back from the newest and stop once
+            # `limit` live docs are found and the date drops below the last of them
+            candidates = range(lo, hi) if docs is None else sorted(docs)
+            live = []
+            for doc_id in reversed(candidates):
+                if len(live) >= limit and (not live or segment.date_view[doc_id] < segment.date_view[live[-1]]):
+                    break
+                if not all(any(p.matches(doc_id) for p in phrases) for phrases in groups):
+                    continue
+                if self.manifest["episodes"].get(segment.doc_pid(doc_id), [None])[0] == segment.name:
+                    live.append(doc_id)
+            results.extend((segment, doc_id) for doc_id in live)
+
+        results.sort(key=lambda r: (-r[0].date_view[r[1]], r[0].name, r[1]))
+        return [segment.doc(doc_id) for segment, doc_id in results[:limit]]
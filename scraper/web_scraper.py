@@ -1,23 +1,58 @@
 import requests
 import re
 import time
+import threading
 from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 
 MAX_WORKERS = 5
+REQUESTS_PER_SECOND = 10
 
 
 class WebScraper:
-    def __init__(self):
+    def __init__(self, max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
         })
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+
+        # One pool and one rate limit shared by everything fetched through this scraper
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.min_interval = 1 / requests_per_second if requests_per_second else 0
+        self._rate_lock = threading.Lock()
+        self._next_request = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _throttle(self):
+        if not self.min_interval:
+            return
+
+        with self._rate_lock:
+            now = time.monotonic()
+            wait_time = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.min_interval
+
+        if wait_time > 0:
+            time.sleep(wait_time)
 
     def _get_soup(self, url, max_retries=3, timeout=60):
         for attempt in range(max_retries):
             try:
+                self._throttle()
                 resp = self.session.get(url, timeout=timeout)
                 resp.raise_for_status()
                 return BeautifulSoup(resp.text, 'html.parser')
@@ -88,37 +123,38 @@ class WebScraper:
         all_pids = []
         pages = [f"https://www.bbc.co.uk/programmes/{series_id}/episodes/guide?page={i}" for i in range(first_page, last_page + 1)]
 
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_page = {executor.submit(self._get_soup, url): url for url in pages}
-            completed_pages = 0
-            for future in as_completed(future_to_page):
-                soup = future.result()
-                if soup:
-                    all_pids.extend([i['data-pid'] for i in soup.find_all(attrs={"data-pid": True})])
-                completed_pages += 1
-                print(f"Indexing: {completed_pages}/{len(pages)} pages processed", end='\r')
+        future_to_page = {self.executor.submit(self._get_soup, url): url for url in pages}
+        completed_pages = 0
+        for future in as_completed(future_to_page):
+            soup = future.result()
+            if soup:
+                all_pids.extend([i['data-pid'] for i in soup.find_all(attrs={"data-pid": True})])
+            completed_pages += 1
+            print(f"Indexing: {completed_pages}/{len(pages)} pages processed", end='\r')
 
         print(f"\nFound {len(all_pids)} episode(s) in index")
 
+        episodes = self.get_episodes(list(set(all_pids)))
+        return sorted(episodes, key=lambda x: x['date'] or '', reverse=True)
+
+    def get_episodes(self, pids):
         episodes = []
-        unique_pids = list(set(all_pids))
-        total_pids = len(unique_pids)
+        total_pids = len(pids)
 
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_pid = {executor.submit(self.get_episode, pid): pid for pid in unique_pids}
-            completed_episodes = 0
+        future_to_pid = {self.executor.submit(self.get_episode, pid): pid for pid in pids}
+        completed_episodes = 0
 
-            for future in as_completed(future_to_pid):
-                result = future.result()
+        for future in as_completed(future_to_pid):
+            result = future.result()
 
-                if result:
-                    episodes.append(result)
+            if result:
+                episodes.append(result)
 
-                completed_episodes += 1
-                print(f"Scraping: {completed_episodes}/{total_pids} episodes", end='\r')
+            completed_episodes += 1
+            print(f"Scraping: {completed_episodes}/{total_pids} episodes", end='\r')
 
         print(f"\n")
-        return sorted(episodes, key=lambda x: x['date'] or '', reverse=True)
+        return episodes
 
     def get_all_episodes(self, series_id):
         url = f"https://www.bbc.co.uk/programmes/{series_id}/episodes/guide"